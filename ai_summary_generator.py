@@ -4,30 +4,54 @@ AI Summary Generator
 Creates insightful, actionable summaries of user flows using GPT
 """
 
+import asyncio
+import hashlib
+import json
 import os
-from typing import List
-from openai import OpenAI
-import dotenv
+import re
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from api_retry import CircuitBreaker, acall_with_retry, call_with_retry
+from cache import cache_delete, cache_put, cache_read
 from flow_parser import UserAction
+from openai_client import get_async_client, get_client
 
-dotenv.load_dotenv()
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib json module is the fallback
+    orjson = None
 
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
-class AISummaryGenerator:
-    """Generates insightful, actionable summaries using GPT"""
-    
-    def __init__(self):
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=api_key)
-    
-    def generate_summary(self, actions: List[UserAction], flow_name: str) -> dict:
-        """Generate insightful, actionable summary from user actions"""
-        
-        action_context = self._build_action_context(actions)
-        
-        system_prompt = """You are a UX/UI analyst and business intelligence expert. Your job is to analyze user flow data and provide actionable insights that help product teams improve their applications.
+# In-process cache of chat completion content, keyed by SHA256 of the request and
+# backed by the on-disk cache so repeat runs over the same flow skip the API
+_CACHE_MAX_SIZE = 500
+_CACHE_TTL_SECONDS = 3600
+_response_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Shared by every chat completion call so a failing API stops being hammered
+_circuit_breaker = CircuitBreaker()
+
+# Behavioral context clues added to each action line of the prompt, by action type
+_CONTEXT_SUFFIXES = {
+    'search': " [INTENT: Product discovery initiated]",
+    'select_product': " [CONVERSION: Moved from browse to product focus]",
+    'select_option': " [DECISION: Made customization choice]",
+    'browse_options': " [EXPLORATION: Comparing alternatives before deciding]",
+    'add_to_cart': " [CONVERSION: Purchase intent confirmed]",
+    'decline_option': " [PRICE SENSITIVITY: Rejected additional cost]",
+    'navigate_cart': " [VERIFICATION: Confirming purchase decision]",
+    'complete': " [SUCCESS: Flow completed successfully]",
+}
+_SEARCH_QUERY_SUFFIX = " [SEARCH QUERY: '{}' - specific product interest]"
+
+# Static system prompt for the detailed analysis. Per-flow data always goes in the user
+# message so this forms a byte-identical prefix across calls (eligible for prompt caching)
+_ANALYSIS_SYSTEM_PROMPT = """You are a UX/UI analyst and business intelligence expert. Your job is to analyze user flow data and provide actionable insights that help product teams improve their applications.
 
 When analyzing user flows, focus on:
 1. USER BEHAVIOR PATTERNS - What the user's actions reveal about their mindset and preferences
@@ -35,14 +59,9 @@ When analyzing user flows, focus on:
 3. BUSINESS INTELLIGENCE - Conversion patterns, friction points, success indicators
 4. ACTIONABLE RECOMMENDATIONS - Specific suggestions for improvement
 
-Write your analysis in a professional, insightful tone that provides value to product managers, UX designers, and developers. Avoid simply retelling what happened - instead, explain WHY it happened and what it means."""
+Write your analysis in a professional, insightful tone that provides value to product managers, UX designers, and developers. Avoid simply retelling what happened - instead, explain WHY it happened and what it means.
 
-        user_prompt = f"""Analyze this user flow: "{flow_name}"
-
-DETAILED USER ACTIONS:
-{action_context}
-
-Provide an insightful analysis covering:
+For each user flow you are given, provide an insightful analysis covering:
 
 1. **User Journey Analysis**: What was the user's primary goal and how effectively did they achieve it?
 
@@ -56,104 +75,615 @@ Provide an insightful analysis covering:
 
 Keep the analysis concise but insightful (3-4 paragraphs total). Focus on insights that would be valuable to product teams."""
 
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_completion_tokens=500,
-                temperature=0.3
-            )
-            
-            detailed_analysis = response.choices[0].message.content.strip()
-            
-            # Generate executive summary
-            exec_summary_prompt = f"""Based on this user flow analysis for "{flow_name}":
+# JSON keys requested from the single-call report and batch report prompts
+_REPORT_FIELDS = """- "detailed_analysis": the analysis described above, as a string (3-4 paragraphs)
+- "executive_summary": a concise executive summary (1-2 sentences) that captures the most important business outcome and user behavior insight
+- "brand": the main brand/company/platform name, or "Unknown" if not clear
+- "product_type": what the user was trying to get/achieve - e.g., "product", "workspace", "dashboard", "meeting setup", "account", etc.
+- "task_type": the main task category - e.g., "online shopping", "workspace setup", "analytics", "collaboration", "onboarding", etc."""
+
+_ANALYSIS_USER_TEMPLATE = """Analyze this user flow: "{flow_name}"
 
-{detailed_analysis}
+DETAILED USER ACTIONS:
+{action_context}"""
 
-Create a concise executive summary (1-2 sentences) that captures the most important business outcome and user behavior insight."""
+# Single-call and batch report prompts extend the analysis prompt so all three share a prefix
+_REPORT_SYSTEM_PROMPT = _ANALYSIS_SYSTEM_PROMPT + """
 
-            exec_response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": "You are a business analyst creating executive summaries."},
-                    {"role": "user", "content": exec_summary_prompt}
-                ],
-                max_completion_tokens=100,
-                temperature=0.2
-            )
+Return your response as a JSON object with exactly these keys:
+""" + _REPORT_FIELDS
+
+_BATCH_SYSTEM_PROMPT = _ANALYSIS_SYSTEM_PROMPT + """
+
+You will be given several user flows. Return your response as a JSON object with a single key "flows": an array with exactly one object per flow, in the order given. Each object must have exactly these keys:
+""" + _REPORT_FIELDS
+
+_BATCH_FLOW_TEMPLATE = """FLOW {index}: "{flow_name}"
+
+DETAILED USER ACTIONS:
+{action_context}"""
+
+_EXEC_SYSTEM_PROMPT = """You are a business analyst creating executive summaries.
+
+Given a user flow analysis, create a concise executive summary (1-2 sentences) that captures the most important business outcome and user behavior insight."""
+
+_EXEC_USER_TEMPLATE = """User flow analysis for "{flow_name}":
+
+{detailed_analysis}"""
+
+_EXTRACTION_SYSTEM_PROMPT = """You are an expert at extracting key information from user flows for social media content. Be precise and concise.
+
+Analyze the user flow you are given and extract key information for social media content generation.
+
+Please extract and return ONLY the following information in this exact format:
+
+BRAND: [The main brand/company/platform name, or "Unknown" if not clear]
+PRODUCT_TYPE: [What the user was trying to get/achieve - e.g., "product", "workspace", "dashboard", "meeting setup", "account", etc.]
+TASK_TYPE: [The main task category - e.g., "online shopping", "workspace setup", "analytics", "collaboration", "onboarding", etc.]
+
+Be concise and specific. Focus on what would make sense for social media sharing."""
+
+_EXTRACTION_USER_TEMPLATE = """Flow Title: "{flow_name}"
+
+User Actions:
+{action_context}"""
+
+# "BRAND: ..." style lines in the extraction response, mapped onto insight keys
+_EXTRACTION_FIELD_RE = re.compile(r'^[^\S\n]*(BRAND|PRODUCT_TYPE|TASK_TYPE):[^\S\n]*(.*?)[^\S\n]*$', re.MULTILINE)
+_EXTRACTION_FIELDS = {
+    'BRAND': 'extracted_brand',
+    'PRODUCT_TYPE': 'product_type',
+    'TASK_TYPE': 'task_type',
+}
+
+# Maximum number of flows packed into one generate_summaries_batch request
+_BATCH_SIZE = 8
+
+# OpenAI Batch API job polling
+_BATCH_API_POLL_SECONDS = 30.0
+_BATCH_API_DONE_STATUSES = frozenset({'completed', 'failed', 'expired', 'cancelled'})
+
+
+@lru_cache(maxsize=128)
+def _render_action_context(action_rows: Tuple[Tuple[int, str, str, str], ...]) -> str:
+    """Render (step_number, action_type, description, element_text) rows as prompt lines"""
+    return "\n".join(
+        f"{step_number}. {description}{_context_suffix(action_type, element_text)}"
+        for step_number, action_type, description, element_text in action_rows
+    )
+
+
+def _context_suffix(action_type: str, element_text: str) -> str:
+    """Behavioral context clue appended to an action line"""
+    if action_type == 'type':
+        return _SEARCH_QUERY_SUFFIX.format(element_text)
+    return _CONTEXT_SUFFIXES.get(action_type, "")
+
+
+# JSON parsing for model output and sorted-key encoding for cache keys
+if orjson is not None:
+    _json_loads = orjson.loads
+
+    def _canonical_json(payload: dict) -> bytes:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+else:
+    _json_loads = json.loads
+
+    def _canonical_json(payload: dict) -> bytes:
+        return json.dumps(payload, sort_keys=True).encode()
+
+
+def _cache_key(request: dict) -> str:
+    """Hash a chat completion request, ignoring whitespace differences in message content"""
+    payload = dict(request)
+    payload['messages'] = [
+        {**message, 'content': _WHITESPACE_RE.sub(' ', message['content']).strip()}
+        for message in request['messages']
+    ]
+    return hashlib.sha256(_canonical_json(payload)).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    """Return cached content for key, falling back to the on-disk cache for a cold process"""
+    content = _memory_get(key)
+    if content is None:
+        disk_entry = _disk_get(key)
+        if disk_entry is not None:
+            content = _remember(key, *disk_entry)
+    return content
+
+
+async def _acache_get(key: str) -> Optional[str]:
+    """Async variant of _cache_get; the disk read runs in a worker thread"""
+    content = _memory_get(key)
+    if content is None:
+        disk_entry = await asyncio.to_thread(_disk_get, key)
+        if disk_entry is not None:
+            content = _remember(key, *disk_entry)
+    return content
+
+
+def _cache_put(key: str, content: str) -> None:
+    """Store content for key in memory and on disk"""
+    _remember(key, 0.0, content)
+    cache_put(f"{key}.txt", content.encode('utf-8'))
+
+
+async def _acache_put(key: str, content: str) -> None:
+    """Async variant of _cache_put; the disk write runs in a worker thread"""
+    _remember(key, 0.0, content)
+    await asyncio.to_thread(cache_put, f"{key}.txt", content.encode('utf-8'))
+
+
+def _memory_get(key: str) -> Optional[str]:
+    """Return in-memory content for key, or None if it is missing or past the TTL"""
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, content = entry
+    if time.monotonic() - stored_at > _CACHE_TTL_SECONDS:
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return content
+
+
+def _disk_get(key: str) -> Optional[Tuple[float, str]]:
+    """Return (age, content) for key from disk, deleting the entry once it is past the TTL
+    
+    Disk entries age from their file mtime, so the TTL holds whichever copy serves them.
+    """
+    disk_entry = cache_read(f"{key}.txt")
+    if disk_entry is None:
+        return None
+    age, data = disk_entry
+    if age > _CACHE_TTL_SECONDS:
+        cache_delete(f"{key}.txt")
+        return None
+    return age, data.decode('utf-8')
+
+
+def _remember(key: str, age: float, content: str) -> str:
+    """Keep content in memory as if it had been stored age seconds ago"""
+    _response_cache[key] = (time.monotonic() - age, content)
+    _response_cache.move_to_end(key)
+    _evict_overflow()
+    return content
+
+
+def _cache_evict(key: str) -> None:
+    """Forget key in memory and on disk, so a bad response isn't replayed"""
+    _response_cache.pop(key, None)
+    cache_delete(f"{key}.txt")
+
+
+def _check_json_output(request: dict, content: str, finish_reason: Optional[str]) -> None:
+    """Raise ValueError if a JSON-mode request came back truncated or unparseable, before it is cached"""
+    if 'response_format' not in request:
+        return
+    if finish_reason == 'length':
+        raise ValueError("JSON response was cut off at the completion token limit")
+    _json_loads(content)  # Both orjson's and json's decode errors are ValueErrors
+
+
+def _evict_overflow() -> None:
+    """Drop the least recently used in-memory entries beyond _CACHE_MAX_SIZE"""
+    while len(_response_cache) > _CACHE_MAX_SIZE:
+        _response_cache.popitem(last=False)
+
+
+class AISummaryGenerator:
+    """Generates insightful, actionable summaries using GPT"""
+    
+    # Flagship model for the analysis itself, cheaper model for short rewrites/extraction
+    MODEL = "gpt-4.1"
+    FAST_MODEL = "gpt-4o-mini"
+    
+    # Completion token budgets per request type (report budgets are per flow)
+    MAX_TOKENS_DETAILED = 500
+    MAX_TOKENS_EXEC = 100
+    MAX_TOKENS_EXTRACTION = 150
+    MAX_TOKENS_REPORT = 700
+    
+    def __init__(self):
+        # openai and dotenv are imported lazily so the deterministic helpers
+        # (generate_insights' funnel logic, flow classification) stay cheap to import
+        if 'OPENAI_API_KEY' not in os.environ:
+            import dotenv
+            dotenv.load_dotenv()
+        
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY environment variable is required")
+    
+    @property
+    def client(self) -> "OpenAI":
+        """Process-wide sync OpenAI client"""
+        return get_client()
+    
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """Process-wide async OpenAI client for the running event loop"""
+        return get_async_client()
+    
+    def generate_summary(self, actions: List[UserAction], flow_name: str) -> dict:
+        """Generate insightful, actionable summary from user actions"""
+        try:
+            detailed_analysis = self._complete(self._analysis_request(actions, flow_name))
             
-            executive_summary = exec_response.choices[0].message.content.strip()
+            # Generate executive summary
+            executive_summary = self._complete(self._exec_summary_request(flow_name, detailed_analysis))
             
-            return {
-                "detailed_analysis": detailed_analysis,
-                "executive_summary": executive_summary,
-                "flow_name": flow_name,
-                "total_actions": len(actions)
-            }
+            return self._summary_result(detailed_analysis, executive_summary, actions, flow_name)
             
         except Exception as e:
-            return {
-                "detailed_analysis": f"Error generating analysis: {str(e)}",
-                "executive_summary": f"Analysis of {flow_name} encountered an error",
-                "flow_name": flow_name,
-                "total_actions": len(actions)
-            }
+            return self._summary_error(e, actions, flow_name)
     
-    def _build_action_context(self, actions: List[UserAction]) -> str:
-        """Build rich context for each action to help GPT understand user behavior"""
-        context_lines = []
+    def stream_summary(self, actions: List[UserAction], flow_name: str) -> Iterator[str]:
+        """Sync variant of astream_summary"""
+        request = self._analysis_request(actions, flow_name)
+        key = _cache_key(request)
+        cached = _cache_get(key)
+        if cached is not None:
+            yield cached
+            return
         
-        for action in actions:
-            context = f"{action.step_number}. {action.description}"
+        chunks = []
+        stream = call_with_retry(lambda: self.client.chat.completions.create(**request, stream=True), _circuit_breaker)
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                chunks.append(delta)
+                yield delta
+        _cache_put(key, "".join(chunks).strip())
+    
+    async def astream_summary(self, actions: List[UserAction], flow_name: str) -> AsyncIterator[str]:
+        """Stream the detailed analysis text as it is generated
+        
+        Once the stream finishes the full text goes into the response cache, so a
+        following generate_summary/agenerate_summary call for the same flow reuses it
+        and only waits on the executive summary.
+        """
+        request = self._analysis_request(actions, flow_name)
+        key = _cache_key(request)
+        cached = await _acache_get(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
+        stream = await acall_with_retry(
+            lambda: self.async_client.chat.completions.create(**request, stream=True), _circuit_breaker
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                chunks.append(delta)
+                yield delta
+        await _acache_put(key, "".join(chunks).strip())
+    
+    def generate_report(self, actions: List[UserAction], flow_name: str) -> Tuple[dict, dict]:
+        """Generate summary and insights together with a single structured GPT call
+        
+        Returns the same (summary, insights) shapes as generate_summary and
+        generate_insights, but in one round trip instead of three.
+        """
+        request = self._report_request(actions, flow_name)
+        try:
+            report = _json_loads(self._complete(request))
+            return self._report_results(report, actions, flow_name)
+        except Exception as e:
+            _cache_evict(_cache_key(request))
+            insights = self._build_insights(actions)
+            insights.update(self._extraction_fallback())
+            return self._summary_error(e, actions, flow_name), insights
+    
+    def generate_summaries_batch(self, flows: List[Tuple[List[UserAction], str]]) -> List[Tuple[dict, dict]]:
+        """Generate (summary, insights) for several (actions, flow_name) pairs, packing
+        up to _BATCH_SIZE flows into each GPT call
+        
+        Any batch whose response doesn't hold exactly one entry per flow is retried
+        flow by flow through generate_report.
+        """
+        results = []
+        for start in range(0, len(flows), _BATCH_SIZE):
+            results.extend(self._generate_batch_chunk(flows[start:start + _BATCH_SIZE]))
+        return results
+    
+    def generate_reports_batch_api(self, flows: List[Tuple[List[UserAction], str]],
+                                   poll_interval: float = _BATCH_API_POLL_SECONDS) -> List[Tuple[dict, dict]]:
+        """Generate (summary, insights) for several (actions, flow_name) pairs through the
+        OpenAI Batch API, blocking until the job finishes
+        
+        Batch jobs are billed at half price but can take up to 24 hours, so this is for
+        bulk runs rather than interactive use. Flows already in the response cache are
+        not resubmitted, and any flow the job doesn't answer falls back to generate_report.
+        """
+        keys = []
+        pending = {}
+        for actions, flow_name in flows:
+            request = self._report_request(actions, flow_name)
+            key = _cache_key(request)
+            keys.append(key)
+            if _cache_get(key) is None:
+                pending[key] = request
+        
+        # Identical flows share one batch line, using the request hash as its custom_id
+        if pending:
+            for key, content in self._run_batch_job(pending, poll_interval).items():
+                _cache_put(key, content)
+        
+        results = []
+        for key, (actions, flow_name) in zip(keys, flows):
+            try:
+                results.append(self._report_results(_json_loads(_cache_get(key)), actions, flow_name))
+            except Exception:
+                # Evict first, or generate_report would read the same bad entry instead of calling the API
+                _cache_evict(key)
+                results.append(self.generate_report(actions, flow_name))
+        return results
+    
+    def _run_batch_job(self, requests: Dict[str, dict], poll_interval: float) -> Dict[str, str]:
+        """Submit chat completion requests keyed by custom_id as one batch job and return
+        the content of every request that succeeded with usable output"""
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": request})
+            for custom_id, request in requests.items()
+        ]
+        input_file = call_with_retry(lambda: self.client.files.create(
+            file=("report_requests.jsonl", "\n".join(lines).encode('utf-8')),
+            purpose="batch"
+        ), _circuit_breaker)
+        batch = call_with_retry(lambda: self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        ), _circuit_breaker)
+        while batch.status not in _BATCH_API_DONE_STATUSES:
+            time.sleep(poll_interval)
+            batch = call_with_retry(lambda: self.client.batches.retrieve(batch.id), _circuit_breaker)
+        
+        if not batch.output_file_id:
+            return {}
+        
+        output = call_with_retry(lambda: self.client.files.content(batch.output_file_id), _circuit_breaker)
+        contents = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            entry = _json_loads(line)
+            response = entry.get('response') or {}
+            if response.get('status_code') != 200:
+                continue
+            choice = response['body']['choices'][0]
+            content = choice['message']['content'].strip()
+            try:
+                _check_json_output(requests[entry['custom_id']], content, choice.get('finish_reason'))
+            except ValueError:
+                continue  # Left out so the caller retries it live rather than caching it
+            contents[entry['custom_id']] = content
+        return contents
+    
+    async def agenerate_summary(self, actions: List[UserAction], flow_name: str) -> dict:
+        """Async variant of generate_summary"""
+        try:
+            detailed_analysis = await self._acomplete(self._analysis_request(actions, flow_name))
+            
+            # The executive summary is built from the detailed analysis, so it has to wait for it
+            executive_summary = await self._acomplete(self._exec_summary_request(flow_name, detailed_analysis))
+            
+            return self._summary_result(detailed_analysis, executive_summary, actions, flow_name)
             
-            # Add behavioral context clues
-            if action.action_type == 'search':
-                context += " [INTENT: Product discovery initiated]"
-            elif action.action_type == 'type':
-                context += f" [SEARCH QUERY: '{action.element_text}' - specific product interest]"
-            elif action.action_type == 'select_product':
-                context += " [CONVERSION: Moved from browse to product focus]"
-            elif action.action_type == 'select_option':
-                context += " [DECISION: Made customization choice]"
-            elif action.action_type == 'browse_options':
-                context += " [EXPLORATION: Comparing alternatives before deciding]"
-            elif action.action_type == 'add_to_cart':
-                context += " [CONVERSION: Purchase intent confirmed]"
-            elif action.action_type == 'decline_option':
-                context += " [PRICE SENSITIVITY: Rejected additional cost]"
-            elif action.action_type == 'navigate_cart':
-                context += " [VERIFICATION: Confirming purchase decision]"
-            elif action.action_type == 'complete':
-                context += " [SUCCESS: Flow completed successfully]"
-                
-            context_lines.append(context)
+        except Exception as e:
+            return self._summary_error(e, actions, flow_name)
+    
+    async def agenerate_flow(self, actions: List[UserAction], flow_name: str) -> Tuple[dict, dict]:
+        """Generate summary and insights for one flow, overlapping the brand extraction with the analysis calls"""
+        summary, insights = await asyncio.gather(
+            self.agenerate_summary(actions, flow_name),
+            self.agenerate_insights(actions, flow_name)
+        )
+        return summary, insights
+    
+    async def agenerate_many(self, flows: List[Tuple[List[UserAction], str]],
+                             max_concurrency: int = 8) -> List[Tuple[dict, dict]]:
+        """Generate (summary, insights) for several (actions, flow_name) pairs concurrently"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(actions: List[UserAction], flow_name: str) -> Tuple[dict, dict]:
+            async with semaphore:
+                return await self.agenerate_flow(actions, flow_name)
+        
+        return await asyncio.gather(*(run(actions, flow_name) for actions, flow_name in flows))
+    
+    def _complete(self, request: dict) -> str:
+        """Run a chat completion request, serving repeats from the response cache"""
+        key = _cache_key(request)
+        content = _cache_get(key)
+        if content is None:
+            response = call_with_retry(lambda: self.client.chat.completions.create(**request), _circuit_breaker)
+            choice = response.choices[0]
+            content = choice.message.content.strip()
+            _check_json_output(request, content, choice.finish_reason)
+            _cache_put(key, content)
+        return content
+    
+    async def _acomplete(self, request: dict) -> str:
+        """Async variant of _complete"""
+        key = _cache_key(request)
+        content = await _acache_get(key)
+        if content is None:
+            response = await acall_with_retry(
+                lambda: self.async_client.chat.completions.create(**request), _circuit_breaker
+            )
+            choice = response.choices[0]
+            content = choice.message.content.strip()
+            _check_json_output(request, content, choice.finish_reason)
+            await _acache_put(key, content)
+        return content
+    
+    def _analysis_request(self, actions: List[UserAction], flow_name: str) -> dict:
+        """Build the chat completion request for the detailed analysis"""
+        return {
+            "model": self.MODEL,
+            "messages": [
+                {"role": "system", "content": _ANALYSIS_SYSTEM_PROMPT},
+                {"role": "user", "content": _ANALYSIS_USER_TEMPLATE.format(
+                    flow_name=flow_name,
+                    action_context=self._build_action_context(actions)
+                )}
+            ],
+            "max_completion_tokens": self.MAX_TOKENS_DETAILED,
+            "temperature": 0.3
+        }
+    
+    def _exec_summary_request(self, flow_name: str, detailed_analysis: str) -> dict:
+        """Build the chat completion request for the executive summary"""
+        return {
+            "model": self.FAST_MODEL,
+            "messages": [
+                {"role": "system", "content": _EXEC_SYSTEM_PROMPT},
+                {"role": "user", "content": _EXEC_USER_TEMPLATE.format(
+                    flow_name=flow_name,
+                    detailed_analysis=detailed_analysis
+                )}
+            ],
+            "max_completion_tokens": self.MAX_TOKENS_EXEC,
+            "temperature": 0.2
+        }
+    
+    def _report_request(self, actions: List[UserAction], flow_name: str) -> dict:
+        """Build the single JSON-mode request used by generate_report"""
+        request = self._analysis_request(actions, flow_name)
+        request['messages'][0] = {"role": "system", "content": _REPORT_SYSTEM_PROMPT}
+        request['response_format'] = {"type": "json_object"}
+        request['max_completion_tokens'] = self.MAX_TOKENS_REPORT
+        return request
+    
+    def _generate_batch_chunk(self, flows: List[Tuple[List[UserAction], str]]) -> List[Tuple[dict, dict]]:
+        """Run one batch request, falling back to per-flow reports if the response doesn't line up"""
+        if len(flows) == 1:
+            return [self.generate_report(*flows[0])]
         
-        return "\n".join(context_lines)
+        request = self._batch_request(flows)
+        try:
+            entries = _json_loads(self._complete(request))['flows']
+            if len(entries) != len(flows):
+                raise ValueError(f"Expected {len(flows)} flow entries, got {len(entries)}")
+            return [
+                self._report_results(entry, actions, flow_name)
+                for (actions, flow_name), entry in zip(flows, entries)
+            ]
+        except Exception:
+            _cache_evict(_cache_key(request))
+            return [self.generate_report(actions, flow_name) for actions, flow_name in flows]
+    
+    def _batch_request(self, flows: List[Tuple[List[UserAction], str]]) -> dict:
+        """Build one JSON-mode request covering several flows"""
+        flow_blocks = "\n\n".join(
+            _BATCH_FLOW_TEMPLATE.format(
+                index=index,
+                flow_name=flow_name,
+                action_context=self._build_action_context(actions)
+            )
+            for index, (actions, flow_name) in enumerate(flows, 1)
+        )
+
+        return {
+            "model": self.MODEL,
+            "messages": [
+                {"role": "system", "content": _BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": f"Analyze the following {len(flows)} user flows.\n\n{flow_blocks}"}
+            ],
+            "max_completion_tokens": self.MAX_TOKENS_REPORT * len(flows),
+            "temperature": 0.3,
+            "response_format": {"type": "json_object"}
+        }
+    
+    def _report_results(self, report: dict, actions: List[UserAction], flow_name: str) -> Tuple[dict, dict]:
+        """Turn one JSON report entry into (summary, insights)"""
+        summary = self._summary_result(
+            report['detailed_analysis'].strip(),
+            report['executive_summary'].strip(),
+            actions,
+            flow_name
+        )
+        insights = self._build_insights(actions)
+        insights.update(self._report_extraction(report))
+        return summary, insights
+    
+    def _report_extraction(self, report: dict) -> dict:
+        """Map the brand/context keys of a JSON report onto the insights format"""
+        fallback = self._extraction_fallback()
+        return {
+            'extracted_brand': report.get('brand') or fallback['extracted_brand'],
+            'product_type': report.get('product_type') or fallback['product_type'],
+            'task_type': report.get('task_type') or fallback['task_type']
+        }
+    
+    def _summary_result(self, detailed_analysis: str, executive_summary: str,
+                        actions: List[UserAction], flow_name: str) -> dict:
+        """Assemble the summary dict returned to callers"""
+        return {
+            "detailed_analysis": detailed_analysis,
+            "executive_summary": executive_summary,
+            "flow_name": flow_name,
+            "total_actions": len(actions)
+        }
+    
+    def _summary_error(self, error: Exception, actions: List[UserAction], flow_name: str) -> dict:
+        """Fallback summary dict used when the API calls fail"""
+        return self._summary_result(
+            f"Error generating analysis: {str(error)}",
+            f"Analysis of {flow_name} encountered an error",
+            actions,
+            flow_name
+        )
+    
+    def _build_action_context(self, actions: List[UserAction]) -> str:
+        """Build rich context for each action to help GPT understand user behavior"""
+        # Render from a hashable snapshot so repeat calls for the same flow hit the LRU cache
+        return _render_action_context(tuple(
+            (action.step_number, action.action_type, action.description, action.element_text)
+            for action in actions
+        ))
     
     def generate_insights(self, actions: List[UserAction], flow_name: str = "Unknown Flow") -> dict:
         """Generate enhanced insights with UX/business focus"""
+        insights = self._build_insights(actions)
         
-        action_types = {}
-        for action in actions:
-            action_types[action.action_type] = action_types.get(action.action_type, 0) + 1
+        # Ask LLM to extract brand and context information for social media
+        extraction_insights = self._extract_brand_and_context(actions, flow_name)
+        insights.update(extraction_insights)
+        
+        return insights
+    
+    async def agenerate_insights(self, actions: List[UserAction], flow_name: str = "Unknown Flow") -> dict:
+        """Async variant of generate_insights"""
+        insights = self._build_insights(actions)
+        insights.update(await self._aextract_brand_and_context(actions, flow_name))
+        return insights
+    
+    def _build_insights(self, actions: List[UserAction]) -> dict:
+        """Deterministic conversion funnel and behavior analysis (no API calls)"""
+        
+        # One pass over the actions; everything below is a membership test on the counts
+        action_types = Counter(action.action_type for action in actions)
         
         # Pattern detection
-        has_search = any(action.action_type == 'search' for action in actions)
-        has_customization = any(action.action_type in ['select_option', 'browse_options'] for action in actions)
-        has_purchase = any(action.action_type == 'add_to_cart' for action in actions)
-        completed = any(action.action_type == 'complete' for action in actions)
-        declined_upsell = any(action.action_type == 'decline_option' for action in actions)
+        has_search = 'search' in action_types
+        has_customization = 'select_option' in action_types or 'browse_options' in action_types
+        has_purchase = 'add_to_cart' in action_types
+        completed = 'complete' in action_types
+        declined_upsell = 'decline_option' in action_types
+        has_product = 'select_product' in action_types
         
         # Calculate conversion metrics
-        search_to_product = has_search and any(action.action_type == 'select_product' for action in actions)
-        product_to_cart = any(action.action_type == 'select_product' for action in actions) and has_purchase
+        search_to_product = has_search and has_product
+        product_to_cart = has_product and has_purchase
         
-        insights = {
-            "action_breakdown": action_types,
+        return {
+            "action_breakdown": dict(action_types),
             "conversion_funnel": {
                 "search_initiated": has_search,
                 "product_selected": search_to_product,
@@ -169,12 +699,6 @@ Create a concise executive summary (1-2 sentences) that captures the most import
             },
             "flow_classification": self._classify_flow_type(has_search, has_customization, has_purchase, completed)
         }
-        
-        # Ask LLM to extract brand and context information for social media
-        extraction_insights = self._extract_brand_and_context(actions, flow_name)
-        insights.update(extraction_insights)
-        
-        return insights
     
     def _classify_flow_type(self, has_search: bool, has_customization: bool, has_purchase: bool, completed: bool) -> str:
         """Enhanced flow classification with business context"""
@@ -194,70 +718,50 @@ Create a concise executive summary (1-2 sentences) that captures the most import
     
     def _extract_brand_and_context(self, actions: List[UserAction], flow_name: str) -> dict:
         """Use LLM to extract brand, product type, and task type for social media generation"""
-        
-        action_context = self._build_action_context(actions)
-        
-        extraction_prompt = f"""Analyze this user flow and extract key information for social media content generation.
-
-Flow Title: "{flow_name}"
-
-User Actions:
-{action_context}
-
-Please extract and return ONLY the following information in this exact format:
-
-BRAND: [The main brand/company/platform name, or "Unknown" if not clear]
-PRODUCT_TYPE: [What the user was trying to get/achieve - e.g., "product", "workspace", "dashboard", "meeting setup", "account", etc.]
-TASK_TYPE: [The main task category - e.g., "online shopping", "workspace setup", "analytics", "collaboration", "onboarding", etc.]
-
-Be concise and specific. Focus on what would make sense for social media sharing."""
-
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": "You are an expert at extracting key information from user flows for social media content. Be precise and concise."},
-                    {"role": "user", "content": extraction_prompt}
-                ],
-                max_completion_tokens=150,
-                temperature=0.3
-            )
-            
-            extraction_text = response.choices[0].message.content.strip()
+            extraction_text = self._complete(self._extraction_request(actions, flow_name))
             
             # Parse the LLM response
-            extracted_info = self._parse_extraction_response(extraction_text)
+            return self._parse_extraction_response(extraction_text)
             
-            return extracted_info
-            
-        except Exception as e:
+        except Exception:
             # Fallback to unknown values
-            return {
-                'extracted_brand': 'Unknown',
-                'product_type': 'workflow',
-                'task_type': 'digital workflow'
-            }
+            return self._extraction_fallback()
+    
+    async def _aextract_brand_and_context(self, actions: List[UserAction], flow_name: str) -> dict:
+        """Async variant of _extract_brand_and_context"""
+        try:
+            extraction_text = await self._acomplete(self._extraction_request(actions, flow_name))
+            return self._parse_extraction_response(extraction_text)
+        except Exception:
+            return self._extraction_fallback()
+    
+    def _extraction_request(self, actions: List[UserAction], flow_name: str) -> dict:
+        """Build the chat completion request for brand/context extraction"""
+        return {
+            "model": self.FAST_MODEL,
+            "messages": [
+                {"role": "system", "content": _EXTRACTION_SYSTEM_PROMPT},
+                {"role": "user", "content": _EXTRACTION_USER_TEMPLATE.format(
+                    flow_name=flow_name,
+                    action_context=self._build_action_context(actions)
+                )}
+            ],
+            "max_completion_tokens": self.MAX_TOKENS_EXTRACTION,
+            "temperature": 0.3
+        }
+    
+    def _extraction_fallback(self) -> dict:
+        """Default brand/context values used when extraction fails"""
+        return {
+            'extracted_brand': 'Unknown',
+            'product_type': 'workflow',
+            'task_type': 'digital workflow'
+        }
     
     def _parse_extraction_response(self, response_text: str) -> dict:
         """Parse the LLM extraction response into structured data"""
-        
-        extracted_brand = "Unknown"
-        product_type = "workflow"
-        task_type = "digital workflow"
-        
-        lines = response_text.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('BRAND:'):
-                extracted_brand = line.replace('BRAND:', '').strip()
-            elif line.startswith('PRODUCT_TYPE:'):
-                product_type = line.replace('PRODUCT_TYPE:', '').strip()
-            elif line.startswith('TASK_TYPE:'):
-                task_type = line.replace('TASK_TYPE:', '').strip()
-        
-        return {
-            'extracted_brand': extracted_brand,
-            'product_type': product_type,
-            'task_type': task_type
-        }
\ No newline at end of file
+        extracted_info = self._extraction_fallback()
+        for field, value in _EXTRACTION_FIELD_RE.findall(response_text):
+            extracted_info[_EXTRACTION_FIELDS[field]] = value
+        return extracted_info
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+API Retry Policy
+Retries transient OpenAI errors with exponential backoff behind a circuit breaker,
+and paces calls to rate-limited endpoints
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar('T')
+
+MAX_ATTEMPTS = 5
+BASE_DELAY_SECONDS = 1.0
+MAX_DELAY_SECONDS = 30.0
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling an API after repeated calls fail all their retries, until a cooldown passes"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def check(self) -> None:
+        """Raise CircuitOpenError if the breaker is open"""
+        if self.opened_at is None:
+            return
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            raise CircuitOpenError("OpenAI API circuit breaker is open after repeated failures")
+        # Cooldown over: let a trial call through, a single further failure reopens it
+        self.opened_at = None
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call"""
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        """Count a call that failed all its retries, opening the breaker at the threshold"""
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RateLimiter:
+    """Spaces call start times evenly so at most requests_per_minute begin in any minute"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute
+        self.next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, n: int = 1) -> float:
+        """Claim the next free start slot for n requests' worth of quota and return the seconds until it"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval * n
+            return slot - now
+
+    def acquire(self, n: int = 1) -> None:
+        """Block until this caller's slot comes up; a call counting as n requests holds n slots"""
+        delay = self._reserve(n)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, n: int = 1) -> None:
+        """Async variant of acquire"""
+        delay = self._reserve(n)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, timeouts, connection errors and 5xx responses are worth retrying"""
+    import openai
+    return isinstance(error, (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError
+    ))
+
+
+def _retry_after(error: Exception) -> Optional[str]:
+    """The Retry-After header of a failed response, if the API sent one"""
+    response = getattr(error, 'response', None)
+    return response.headers.get('retry-after') if response is not None else None
+
+
+def counts_toward_breaker(error: Exception) -> bool:
+    """Whether an error exhausting its retries signals an unhealthy API
+    
+    Rate limits (and anything else carrying Retry-After) mean the API is up and
+    telling us to slow down, so they must not trip the breaker shared by every caller.
+    """
+    import openai
+    return not isinstance(error, openai.RateLimitError) and not _retry_after(error)
+
+
+def _backoff_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before the next attempt, honouring Retry-After when the API sends it"""
+    retry_after = _retry_after(error)
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_DELAY_SECONDS)
+        except ValueError:
+            pass
+    delay = min(BASE_DELAY_SECONDS * 2 ** (attempt - 1), MAX_DELAY_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def call_with_retry(func: Callable[[], T], breaker: CircuitBreaker) -> T:
+    """Call func, retrying transient API errors with exponential backoff
+    
+    Only a call that fails every attempt counts toward the breaker, so a burst of
+    concurrent calls each hitting one transient error can't open it.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        breaker.check()
+        try:
+            result = func()
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            if attempt == MAX_ATTEMPTS:
+                if counts_toward_breaker(e):
+                    breaker.record_failure()
+                raise
+            time.sleep(_backoff_delay(e, attempt))
+        else:
+            breaker.record_success()
+            return result
+
+
+async def acall_with_retry(func: Callable[[], Awaitable[T]], breaker: CircuitBreaker) -> T:
+    """Async variant of call_with_retry"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        breaker.check()
+        try:
+            result = await func()
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            if attempt == MAX_ATTEMPTS:
+                if counts_toward_breaker(e):
+                    breaker.record_failure()
+                raise
+            await asyncio.sleep(_backoff_delay(e, attempt))
+        else:
+            breaker.record_success()
+            return result
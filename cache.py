@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+Content-addressed on-disk cache for API results that are expensive to regenerate
+"""
+
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+CACHE_DIR = Path(os.getenv('ARCADE_CACHE_DIR') or Path.home() / '.arcade_cache')
+# Once the cache outgrows this, the oldest entries are deleted (an image is ~2 MB)
+CACHE_MAX_BYTES = int(os.getenv('ARCADE_CACHE_MAX_MB') or 512) * 1024 * 1024
+
+# Bytes this process believes are on disk, so a put only rescans the directory when
+# it crosses CACHE_MAX_BYTES; None until the first put has scanned it
+_cache_bytes: Optional[int] = None
+_cache_bytes_lock = threading.Lock()
+
+
+def cache_get(key: str) -> Optional[bytes]:
+    """Return the bytes stored under key, or None on a miss"""
+    try:
+        return (CACHE_DIR / key).read_bytes()
+    except OSError:
+        return None
+
+
+def cache_read(key: str) -> Optional[Tuple[float, bytes]]:
+    """Return (age in seconds, bytes) for the entry stored under key, or None on a miss"""
+    path = CACHE_DIR / key
+    try:
+        age = time.time() - path.stat().st_mtime
+        return age, path.read_bytes()
+    except OSError:
+        return None
+
+
+def cache_put(key: str, data: bytes) -> None:
+    """Store data under key; the entry is written to a temp file and renamed so readers never see it half-written"""
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    except OSError:
+        return  # Caching is best effort; an unwritable cache dir must not fail the run
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        try:
+            replaced = (CACHE_DIR / key).stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, CACHE_DIR / key)
+    except OSError:
+        Path(tmp_path).unlink(missing_ok=True)
+        return
+    _add_bytes(len(data) - replaced)
+
+
+def cache_delete(key: str) -> None:
+    """Remove the entry stored under key, if any"""
+    try:
+        (CACHE_DIR / key).unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def _add_bytes(delta: int) -> None:
+    """Update the running size total, pruning once it passes CACHE_MAX_BYTES"""
+    global _cache_bytes
+    with _cache_bytes_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += delta
+            if _cache_bytes <= CACHE_MAX_BYTES:
+                return
+    _prune()
+
+
+def _prune() -> None:
+    """Rescan the cache and delete the oldest entries until it is back under 90% of CACHE_MAX_BYTES
+    
+    Pruning below the cap leaves headroom, so the next rescan is many puts away.
+    The scan also picks up entries written by other processes.
+    """
+    global _cache_bytes
+    entries = []
+    total = 0
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp') or not entry.is_file():
+                    continue  # Temp files are entries still being written
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    except OSError:
+        return
+    
+    target = CACHE_MAX_BYTES * 9 // 10
+    if total > CACHE_MAX_BYTES:
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= target:
+                break
+    with _cache_bytes_lock:
+        _cache_bytes = total
@@ -5,11 +5,67 @@ Extracts user interactions in human-readable format
 """
 
 import json
-from typing import Dict, List, Any
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Any, Optional
 from dataclasses import dataclass
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib json module is the fallback
+    orjson = None
 
-@dataclass
+# Chapter titles containing any of these words mark the end of the flow
+_COMPLETION_TITLE_RE = re.compile(r'thank|complete|finish', re.IGNORECASE)
+# Quoted search term in a results page title, e.g. '"scooter" : Target'
+_SEARCH_TERM_TITLE_RE = re.compile(r'"([^"]+)"\s*:')
+
+# Hotspot label rules in priority order, matched against the lowercased label:
+# (keywords that must all appear, keywords of which one must appear, action_type,
+#  description template filled with the element text)
+_HOTSPOT_RULES = (
+    (('search', 'tap'), (), 'search', 'Clicked on the search bar to start looking for products'),
+    ((), ('image', 'learn more', 'view details', 'product'), 'select_product', 'Clicked on the "{}" to view product details'),
+    (('color', 'choose'), (), 'select_option', 'Selected "{}" color option'),
+    (('color', 'explore'), (), 'browse_options', 'Explored "{}" color option'),
+    (('add to cart',), (), 'add_to_cart', 'Clicked "Add to cart" to add the item to shopping cart'),
+    (('decline',), (), 'decline_option', 'Declined the additional option or coverage plan'),
+    (('cart',), (), 'navigate_cart', 'Clicked on the cart icon to review selected items'),
+)
+
+# Element-specific fallbacks for steps without a hotspot label:
+# element_type -> (text test, action_type, description template)
+_ELEMENT_RULES = {
+    'button': (lambda text: 'cart' in text.lower(), 'add_to_cart', 'Clicked "{}" button'),
+    'link': (str.isdigit, 'navigate_cart', 'Clicked on cart (showing {} item)'),
+}
+
+
+@lru_cache(maxsize=512)
+def _classify_hotspot(hotspot_label: str, element_text: str) -> tuple:
+    """Map a hotspot label to (action_type, description); flows repeat labels, so results are memoized"""
+    label_lower = hotspot_label.lower()
+    
+    # Plain loops rather than all()/any() over generators, which cost more than the substring checks
+    for all_keywords, any_keywords, action_type, description in _HOTSPOT_RULES:
+        for keyword in all_keywords:
+            if keyword not in label_lower:
+                break
+        else:
+            if not any_keywords:
+                return action_type, description.format(element_text)
+            for keyword in any_keywords:
+                if keyword in label_lower:
+                    return action_type, description.format(element_text)
+    
+    clean_description = hotspot_label.replace('*', '').strip()
+    if clean_description.endswith('.'):
+        clean_description = clean_description[:-1]
+    return 'action', clean_description
+
+
+@dataclass(slots=True)
 class UserAction:
     """Represents a single user action extracted from the flow"""
     step_number: int
@@ -17,7 +73,7 @@ class UserAction:
     description: str
     element_text: str = ""
     page_title: str = ""
-    timestamp: int = None
+    timestamp: Optional[int] = None
 
 
 class FlowParser:
@@ -26,65 +82,66 @@ class FlowParser:
     def __init__(self, flow_data: Dict[str, Any]):
         self.flow_data = flow_data
         self.flow_name = flow_data.get('name', 'Unknown Flow')
+        self._handlers = {
+            'CHAPTER': self._parse_chapter_step,
+            'IMAGE': self._parse_image_step,
+        }
         
     def parse(self) -> List[UserAction]:
         """Extract all user actions in human-readable format"""
-        actions = []
+        return list(self._iter_actions())
+    
+    def _iter_actions(self) -> Iterator[UserAction]:
+        """Yield user actions in flow order, numbering them as they are produced"""
         steps = self.flow_data.get('steps', [])
         captured_events = self.flow_data.get('capturedEvents', [])
         
-        # Create mapping of click IDs to timestamps
-        event_timestamps = {
-            event.get('clickId'): event.get('timeMs') 
-            for event in captured_events 
-            if event.get('clickId')
-        }
-        
-        # Add typing event if present
-        typing_events = [e for e in captured_events if e.get('type') == 'typing']
+        # Map click IDs to timestamps and find the first typing event in one pass
+        event_timestamps = {}
+        typing_event = None
+        for event in captured_events:
+            click_id = event.get('clickId')
+            if click_id:
+                event_timestamps[click_id] = event.get('timeMs')
+            if typing_event is None and event.get('type') == 'typing':
+                typing_event = event
         
         step_number = 1
         
         for step_index, step in enumerate(steps):
-            step_type = step.get('type')
+            handler = self._handlers.get(step.get('type'))
+            if handler is None:
+                continue
             
-            if step_type == 'CHAPTER':
-                action = self._parse_chapter_step(step, step_number)
-                if action:
-                    actions.append(action)
-                    step_number += 1
-                    
-            elif step_type == 'IMAGE':
-                action = self._parse_image_step(step, step_number, event_timestamps)
-                if action:
-                    # Check if this is after the search click and we have typing
-                    if (action.action_type == 'search' and typing_events and 
-                        len(actions) > 0):
-                        # Add typing action
-                        # Extract search term from the next page title if possible
-                        typed_text = self._extract_search_term_from_context(step, self.flow_data['steps'], step_index)
-                        typing_action = UserAction(
-                            step_number=step_number + 1,
-                            action_type='type',
-                            description=f'Typed "{typed_text}" in the search bar',
-                            element_text=typed_text,
-                            page_title=action.page_title,
-                            timestamp=typing_events[0].get('startTimeMs')
-                        )
-                        actions.append(action)
-                        actions.append(typing_action)
-                        step_number += 2
-                    else:
-                        actions.append(action)
-                        step_number += 1
-        
-        return actions
+            action = handler(step, step_number, event_timestamps)
+            if not action:
+                continue
+            
+            yield action
+            
+            # Check if this is after the search click and we have typing
+            if (action.action_type == 'search' and typing_event is not None and 
+                step_number > 1):
+                # Add typing action
+                # Extract search term from the next page title if possible
+                typed_text = self._extract_search_term_from_context(step, self.flow_data['steps'], step_index)
+                yield UserAction(
+                    step_number=step_number + 1,
+                    action_type='type',
+                    description=f'Typed "{typed_text}" in the search bar',
+                    element_text=typed_text,
+                    page_title=action.page_title,
+                    timestamp=typing_event.get('startTimeMs')
+                )
+                step_number += 2
+            else:
+                step_number += 1
     
-    def _parse_chapter_step(self, step: Dict, step_number: int) -> UserAction:
-        """Parse a CHAPTER step"""
+    def _parse_chapter_step(self, step: Dict, step_number: int, event_timestamps: Dict) -> UserAction:
+        """Parse a CHAPTER step (event_timestamps is unused, shared handler signature)"""
         title = step.get('title', '')
         
-        if any(word in title.lower() for word in ['thank', 'complete', 'finish']):
+        if _COMPLETION_TITLE_RE.search(title):
             return UserAction(
                 step_number=step_number,
                 action_type='complete',
@@ -110,10 +167,10 @@ class FlowParser:
         timestamp = event_timestamps.get(step_id)
         
         # Use hotspot label for human-readable description
-        if hotspots and hotspots[0].get('label'):
-            hotspot_description = hotspots[0]['label']
+        hotspot_label = hotspots[0].get('label') if hotspots else None
+        if hotspot_label:
             action_type, description = self._parse_hotspot_description(
-                hotspot_description, element_text, element_type
+                hotspot_label, element_text, element_type
             )
         else:
             # Fallback to element-based description
@@ -132,35 +189,17 @@ class FlowParser:
     
     def _parse_hotspot_description(self, hotspot_label: str, element_text: str, element_type: str) -> tuple:
         """Parse hotspot label into action type and human description"""
-        label_lower = hotspot_label.lower()
-        
-        if 'search' in label_lower and 'tap' in label_lower:
-            return 'search', 'Clicked on the search bar to start looking for products'
-        elif any(keyword in label_lower for keyword in ['image', 'learn more', 'view details', 'product']):
-            return 'select_product', f'Clicked on the "{element_text}" to view product details'
-        elif 'color' in label_lower and 'choose' in label_lower:
-            return 'select_option', f'Selected "{element_text}" color option'
-        elif 'color' in label_lower and 'explore' in label_lower:
-            return 'browse_options', f'Explored "{element_text}" color option'
-        elif 'add to cart' in label_lower:
-            return 'add_to_cart', 'Clicked "Add to cart" to add the item to shopping cart'
-        elif 'decline coverage' in label_lower or 'decline' in label_lower:
-            return 'decline_option', 'Declined the additional option or coverage plan'
-        elif 'visit your cart' in label_lower or 'cart' in label_lower:
-            return 'navigate_cart', 'Clicked on the cart icon to review selected items'
-        else:
-            clean_description = hotspot_label.replace('*', '').strip()
-            if clean_description.endswith('.'):
-                clean_description = clean_description[:-1]
-            return 'action', clean_description
+        return _classify_hotspot(hotspot_label, element_text)
     
     def _determine_action_from_element(self, element_text: str, element_type: str) -> tuple:
         """Fallback method for elements without hotspot labels"""
-        if element_type == 'button' and 'cart' in element_text.lower():
-            return 'add_to_cart', f'Clicked "{element_text}" button'
-        elif element_type == 'link' and element_text.isdigit():
-            return 'navigate_cart', f'Clicked on cart (showing {element_text} item)'
-        elif element_text:
+        rule = _ELEMENT_RULES.get(element_type)
+        if rule is not None:
+            matches, action_type, description = rule
+            if matches(element_text):
+                return action_type, description.format(element_text)
+        
+        if element_text:
             return 'click', f'Clicked on "{element_text}"'
         else:
             return 'action', 'Performed an action on the page'
@@ -173,8 +212,7 @@ class FlowParser:
             if 'pageContext' in step:
                 page_title = step['pageContext'].get('title', '')
                 # Look for quoted search terms like '"scooter" : Target'
-                import re
-                match = re.search(r'"([^"]+)"\s*:', page_title)
+                match = _SEARCH_TERM_TITLE_RE.search(page_title)
                 if match:
                     return match.group(1)
         
@@ -184,8 +222,8 @@ class FlowParser:
 
 def load_and_parse_flow(file_path: str) -> tuple[List[UserAction], str]:
     """Load flow.json and return parsed actions and flow name"""
-    with open(file_path, 'r') as f:
-        flow_data = json.load(f)
+    data = Path(file_path).read_bytes()
+    flow_data = orjson.loads(data) if orjson is not None else json.loads(data)
     
     parser = FlowParser(flow_data)
     actions = parser.parse()
@@ -3,42 +3,100 @@ Arcade Flow Analyzer
 Complete pipeline: Flow Parsing -> AI Summary -> Image Generation -> Markdown Report
 """
 
+import argparse
+import asyncio
+import glob
 import os
+import re
 from datetime import datetime
-from pathlib import Path
-from flow_parser import load_and_parse_flow
+from functools import lru_cache
+from itertools import count
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+from flow_parser import UserAction, load_and_parse_flow
 from ai_summary_generator import AISummaryGenerator
 from social_image_generator import SocialImageGenerator
 
 
+# Characters dropped from flow names in report filenames: anything but \w (alphanumerics
+# and underscore, Unicode-aware like str.isalnum), spaces and hyphens
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w \-]+')
+
+
+@lru_cache(maxsize=256)
+def _label(key: str) -> str:
+    """Human-readable label for an insights key, e.g. 'cart_conversion' -> 'Cart Conversion'"""
+    return key.replace('_', ' ').title()
+
+
+# Parsed flows by absolute path, with the (mtime, size) they were parsed at, so
+# re-analyzing an unchanged file in the same process skips the parse
+_parse_cache: Dict[str, Tuple[Tuple[int, int], List[UserAction], str]] = {}
+
+
+def _load_flow(flow_file: str) -> Tuple[List[UserAction], str]:
+    """load_and_parse_flow, reusing the previous result while the file is unchanged"""
+    stat = os.stat(flow_file)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    path = os.path.abspath(flow_file)
+    cached = _parse_cache.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = _parse_cache[path] = (stamp, *load_and_parse_flow(flow_file))
+    _, actions, flow_name = cached
+    return list(actions), flow_name
+
+
+def _create_report_file(base_name: str) -> Tuple[str, TextIO]:
+    """Create a new report file named after base_name and return (filename, open file)
+    
+    Flows with the same name analyzed in the same second (e.g. copies of one flow
+    through analyze_many) would share a name, so later ones get a _2, _3, ... suffix
+    instead of overwriting the first.
+    """
+    filename = f"{base_name}.md"
+    for n in count(2):
+        try:
+            return filename, open(filename, 'x', encoding='utf-8', buffering=1 << 16)
+        except FileExistsError:
+            filename = f"{base_name}_{n}.md"
+
+
 class FlowAnalyzer:
     """Main orchestrator that runs the complete analysis pipeline"""
     
-    def __init__(self, flow_file: str = 'flow.json'):
+    def __init__(self, flow_file: str = 'flow.json', summary_generator: Optional[AISummaryGenerator] = None,
+                 image_generator: Optional[SocialImageGenerator] = None):
         self.flow_file = flow_file
-        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Generators can be shared across analyzers; otherwise each run builds its own
+        self.summary_generator = summary_generator
+        self.image_generator = image_generator
+        self.started_at = datetime.now()
+        self.timestamp = self.started_at.strftime("%Y%m%d_%H%M%S")
+        self.analysis_date = self.started_at.strftime("%B %d, %Y at %I:%M %p")
         
     def analyze(self) -> dict:
         """Run the complete analysis pipeline"""
-        results = {}
-        
-        # Parse Flow Data
-        try:
-            actions, flow_name = load_and_parse_flow(self.flow_file)
-            results['actions'] = actions
-            results['flow_name'] = flow_name
-        except Exception as e:
-            results['error'] = str(e)
+        return asyncio.run(self.aanalyze())
+    
+    async def aanalyze(self) -> dict:
+        """Async variant of analyze, overlapping the AI summary with insights and image generation"""
+        results = self._parse_flow()
+        if results.get('error'):
             return results
+        actions = results['actions']
+        flow_name = results['flow_name']
         
-        # Generate AI Summary
+        # Generate AI Summary, Insights and Social Media Image
+        # The image prompt only needs the insights, so it is generated while the summary is still running
         try:
-            summary_generator = AISummaryGenerator()
-            summary_result = summary_generator.generate_summary(actions, flow_name)
-            insights = summary_generator.generate_insights(actions, flow_name)
+            summary_generator = self.summary_generator or AISummaryGenerator()
+            summary_result, (insights, image_filename) = await asyncio.gather(
+                summary_generator.agenerate_summary(actions, flow_name),
+                self._ainsights_and_image(summary_generator, actions, flow_name)
+            )
             
             results['summary'] = summary_result
             results['insights'] = insights
+            results['image_filename'] = image_filename
         except Exception as e:
             results['summary'] = {
                 'detailed_analysis': f"Error generating analysis: {str(e)}",
@@ -47,19 +105,30 @@ class FlowAnalyzer:
                 'total_actions': len(actions)
             }
             results['insights'] = {'flow_classification': 'Unknown', 'user_behavior_indicators': {'completion_rate': 0}}
+            results['image_filename'] = None
         
-        # Generate Social Media Image
+        # Report writing is blocking file I/O; keep it off the event loop so other flows' API calls proceed
+        return await asyncio.to_thread(self._write_report, results)
+    
+    def _parse_flow(self) -> dict:
+        """Parse the flow file into a fresh results dict, or one holding the error"""
+        results = {}
+        
+        # Parse Flow Data
         try:
-            image_generator = SocialImageGenerator()
-            image_filename = image_generator.generate_image(
-                actions, 
-                flow_name, 
-                summary_result, 
-                insights
-            )
-            results['image_filename'] = image_filename
+            actions, flow_name = _load_flow(self.flow_file)
+            results['actions'] = actions
+            results['flow_name'] = flow_name
         except Exception as e:
-            results['image_filename'] = None
+            results['error'] = str(e)
+        
+        return results
+    
+    def _write_report(self, results: dict) -> dict:
+        """Generate the markdown report for finished results and record its filename"""
+        # Stat the image once here; report generation reuses the answer
+        image_filename = results['image_filename']
+        results['image_exists'] = bool(image_filename) and os.path.isfile(image_filename)
         
         # Generate Markdown Report
         try:
@@ -70,25 +139,49 @@ class FlowAnalyzer:
         
         return results
     
+    async def _ainsights_and_image(self, summary_generator: AISummaryGenerator, actions: List[UserAction],
+                                   flow_name: str) -> Tuple[dict, Optional[str]]:
+        """Generate insights, then the social media image built from them"""
+        insights = await summary_generator.agenerate_insights(actions, flow_name)
+        return insights, await self._agenerate_image(actions, flow_name, insights)
+    
+    async def _agenerate_image(self, actions: List[UserAction], flow_name: str, insights: dict) -> Optional[str]:
+        """Generate the social media image, returning None if it fails"""
+        try:
+            image_generator = self.image_generator or SocialImageGenerator()
+            return await image_generator.agenerate_image(actions, flow_name, insights=insights)
+        except Exception as e:
+            return None
+    
     def generate_markdown_report(self, results: dict) -> str:
         """Generate comprehensive markdown report"""
         
+        # Create report filename
+        flow_name = results.get('flow_name', 'Unknown Flow')
+        safe_name = _UNSAFE_FILENAME_RE.sub('', flow_name).strip().replace(' ', '_')
+        report_filename, f = _create_report_file(f"flow_analysis_report_{safe_name}_{self.timestamp}")
+        
+        # Write the markdown file as it is rendered, without holding the whole report in memory
+        with f:
+            f.writelines(self._iter_markdown_chunks(results, report_filename))
+        
+        return report_filename
+    
+    def _iter_markdown_chunks(self, results: dict, report_filename: str) -> Iterator[str]:
+        """Yield the markdown report for results piece by piece"""
         flow_name = results.get('flow_name', 'Unknown Flow')
         actions = results.get('actions', [])
         summary = results.get('summary', {})
         insights = results.get('insights', {})
         image_filename = results.get('image_filename')
+        image_exists = results.get('image_exists')
+        if image_exists is None:
+            image_exists = bool(image_filename) and os.path.isfile(image_filename)
         
-        # Create report filename
-        safe_name = "".join(c for c in flow_name if c.isalnum() or c in (' ', '-', '_')).strip()
-        safe_name = safe_name.replace(' ', '_')
-        report_filename = f"flow_analysis_report_{safe_name}_{self.timestamp}.md"
-        
-        # Generate markdown content
-        markdown_content = f"""# Arcade Flow Analysis Report
+        yield f"""# Arcade Flow Analysis Report
 
 **Flow Name:** {flow_name}  
-**Analysis Date:** {datetime.now().strftime("%B %d, %Y at %I:%M %p")}  
+**Analysis Date:** {self.analysis_date}  
 **Total Actions:** {len(actions)}  
 
 ---
@@ -114,10 +207,9 @@ class FlowAnalyzer:
         conversion_funnel = insights.get('conversion_funnel', {})
         for stage, completed in conversion_funnel.items():
             status = "Yes" if completed else "No"
-            stage_name = stage.replace('_', ' ').title()
-            markdown_content += f"\n- **{stage_name}:** {status}"
+            yield f"\n- **{_label(stage)}:** {status}"
         
-        markdown_content += f"""
+        yield """
 
 ### User Behavior Indicators"""
         
@@ -126,10 +218,9 @@ class FlowAnalyzer:
         for behavior, present in user_behaviors.items():
             if isinstance(present, bool):
                 status = "Yes" if present else "No"
-                behavior_name = behavior.replace('_', ' ').title()
-                markdown_content += f"\n- **{behavior_name}:** {status}"
+                yield f"\n- **{_label(behavior)}:** {status}"
         
-        markdown_content += f"""
+        yield """
 
 ---
 
@@ -141,77 +232,138 @@ The following actions were performed by the user during this flow:
         
         # Add numbered action list
         for action in actions:
-            markdown_content += f"{action.step_number}. **{action.description}**\n"
-            if action.element_text and action.element_text != action.description:
-                markdown_content += f"   - *Element:* {action.element_text}\n"
-            if action.page_title:
-                markdown_content += f"   - *Page:* {action.page_title}\n"
-            markdown_content += "\n"
+            description = action.description
+            element_text = action.element_text
+            page_title = action.page_title
+            yield f"{action.step_number}. **{description}**\n"
+            if element_text and element_text != description:
+                yield f"   - *Element:* {element_text}\n"
+            if page_title:
+                yield f"   - *Page:* {page_title}\n"
+            yield "\n"
         
         # Add action breakdown
         if insights.get('action_breakdown'):
-            markdown_content += "### Action Breakdown\n\n"
+            yield "### Action Breakdown\n\n"
             for action_type, count in insights['action_breakdown'].items():
-                markdown_content += f"- **{action_type.replace('_', ' ').title()}:** {count}\n"
-            markdown_content += "\n"
+                yield f"- **{_label(action_type)}:** {count}\n"
+            yield "\n"
         
         # Add social media image
-        markdown_content += "---\n\n## Social Media Image\n\n"
-        if image_filename and Path(image_filename).exists():
-            markdown_content += f"![Social Media Image for {flow_name}]({image_filename})\n\n"
-            markdown_content += f"*Generated social media image optimized for sharing across platforms*\n\n"
+        yield "---\n\n## Social Media Image\n\n"
+        if image_exists:
+            yield f"![Social Media Image for {flow_name}]({image_filename})\n\n"
+            yield "*Generated social media image optimized for sharing across platforms*\n\n"
         else:
-            markdown_content += "*Social media image not available*\n\n"
+            yield "*Social media image not available*\n\n"
         
         # Add technical details
-        markdown_content += f"""---
+        yield f"""---
 
 ## Technical Details
 
 - **Analysis Tool:** Arcade Flow Analyzer
-- **AI Models Used:** GPT-4.1 (summary), GPT-Image-1 (image generation)
+- **AI Models Used:** GPT-4.1 (analysis), GPT-4o-mini (executive summary, brand extraction), GPT-Image-1 (image generation)
 - **Source Data:** {self.flow_file}
 - **Generated Files:**
   - Report: `{report_filename}`"""
         
         if image_filename:
-            markdown_content += f"\n  - Image: `{image_filename}`"
+            yield f"\n  - Image: `{image_filename}`"
         
-        markdown_content += f"""
+        yield """
 
 ---
 
 *This report was automatically generated by the Arcade Flow Analyzer.*
 """
-        
-        # Write the markdown file
-        with open(report_filename, 'w', encoding='utf-8') as f:
-            f.write(markdown_content)
-        
-        return report_filename
+
+
+async def analyze_many(flow_files: List[str], max_concurrency: int = 8) -> List[dict]:
+    """Analyze several flow files concurrently, sharing one pair of generators"""
+    try:
+        summary_generator = AISummaryGenerator()
+        image_generator = SocialImageGenerator()
+    except Exception:
+        # Leave construction to each analyzer so the failure is reported per flow as usual
+        summary_generator = image_generator = None
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run(flow_file: str) -> dict:
+        async with semaphore:
+            analyzer = FlowAnalyzer(flow_file, summary_generator, image_generator)
+            return await analyzer.aanalyze()
+    
+    return await asyncio.gather(*(run(flow_file) for flow_file in flow_files))
+
+
+def analyze_batch(flow_files: List[str]) -> List[dict]:
+    """Analyze several flows with summaries from the OpenAI Batch API
+    
+    Half the token price of live calls, but the batch job can take up to 24 hours.
+    Images are still generated live once the summaries are back.
+    """
+    summary_generator = AISummaryGenerator()
+    image_generator = SocialImageGenerator()
+    analyzers = [FlowAnalyzer(flow_file, summary_generator, image_generator) for flow_file in flow_files]
+    all_results = [analyzer._parse_flow() for analyzer in analyzers]
+    parsed = [
+        (analyzer, results) for analyzer, results in zip(analyzers, all_results) if not results.get('error')
+    ]
+    
+    reports = summary_generator.generate_reports_batch_api(
+        [(results['actions'], results['flow_name']) for _, results in parsed]
+    )
+    for (_, results), (summary, insights) in zip(parsed, reports):
+        results['summary'] = summary
+        results['insights'] = insights
+    
+    async def generate_images() -> List[Optional[str]]:
+        return await asyncio.gather(*(
+            analyzer._agenerate_image(results['actions'], results['flow_name'], results['insights'])
+            for analyzer, results in parsed
+        ))
+    
+    for (analyzer, results), image_filename in zip(parsed, asyncio.run(generate_images())):
+        results['image_filename'] = image_filename
+        analyzer._write_report(results)
+    
+    return all_results
 
 
 def main():
     """Run the complete flow analysis pipeline"""
+    parser = argparse.ArgumentParser(description="Analyze Arcade flow recordings")
+    parser.add_argument('--flows', default='flow.json', help="flow file or glob pattern (default: flow.json)")
+    parser.add_argument('--max-concurrency', type=int, default=8, help="flows analyzed at the same time (default: 8)")
+    parser.add_argument('--batch-api', action='store_true',
+                        help="with several flows, get summaries from the OpenAI Batch API (half price, up to 24h)")
+    args = parser.parse_args()
     
-    if not Path('flow.json').exists():
-        print("Error: flow.json not found")
+    flow_files = sorted(path for path in glob.glob(args.flows) if os.path.isfile(path))
+    if not flow_files:
+        print(f"Error: {args.flows} not found")
         return
     
     if not os.getenv('OPENAI_API_KEY'):
         print("Error: OPENAI_API_KEY not set")
         return
     
-    analyzer = FlowAnalyzer()
-    results = analyzer.analyze()
-    
-    if results.get('error'):
-        print(f"Failed: {results['error']}")
-    elif results.get('report_filename'):
-        print(f"Complete: {results['report_filename']}")
+    if args.batch_api and len(flow_files) > 1:
+        all_results = analyze_batch(flow_files)
     else:
-        print("Error occurred")
+        all_results = asyncio.run(analyze_many(flow_files, args.max_concurrency))
+    
+    for flow_file, results in zip(flow_files, all_results):
+        prefix = f"{flow_file}: " if len(flow_files) > 1 else ""
+        if results.get('error'):
+            print(f"{prefix}Failed: {results['error']}")
+        elif results.get('report_filename'):
+            print(f"{prefix}Complete: {results['report_filename']}")
+        else:
+            print(f"{prefix}Error occurred")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+OpenAI Clients
+Process-wide OpenAI clients shared by the summary and image generators
+"""
+
+import asyncio
+import importlib.util
+import os
+from typing import TYPE_CHECKING, Any, Coroutine, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+# httpx only speaks HTTP/2 when the optional h2 package is installed
+_HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+_client: Optional["OpenAI"] = None
+# An async connection pool belongs to the event loop it was used on, so the
+# async client is rebuilt when a later asyncio.run() starts a new loop. Each one
+# is closed when its loop shuts down, even if a newer loop has replaced it
+_async_client: Optional[Tuple[Optional[asyncio.AbstractEventLoop], "AsyncOpenAI"]] = None
+# The event loop only keeps weak references to tasks, so the closing tasks live here until done
+_close_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _http_client_options() -> dict:
+    """Keep-alive pool settings shared by the sync and async httpx clients"""
+    import httpx
+    # Keep every pooled connection alive: with a smaller keep-alive cap, bursts of
+    # concurrent flows close and reopen TLS connections instead of reusing them
+    return {
+        'http2': _HTTP2_AVAILABLE,
+        'limits': httpx.Limits(max_keepalive_connections=100, max_connections=100),
+        'timeout': httpx.Timeout(60.0, connect=10.0)
+    }
+
+
+def get_client() -> "OpenAI":
+    """Shared sync OpenAI client, created on first use"""
+    global _client
+    if _client is None:
+        import httpx
+        from openai import OpenAI
+        # Retries are handled by api_retry; the SDK's own retries would multiply them
+        _client = OpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            max_retries=0,
+            http_client=httpx.Client(**_http_client_options())
+        )
+    return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """Shared async OpenAI client for the running event loop, created on first use"""
+    global _async_client
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None  # Built outside a loop; replaced once it is first needed inside one
+    if _async_client is None or _async_client[0] is not loop:
+        import httpx
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            max_retries=0,
+            http_client=httpx.AsyncClient(**_http_client_options())
+        )
+        if loop is not None:
+            if _async_client is not None and _async_client[0] is None:
+                # Built outside any loop, so nothing else will close it
+                _spawn(loop, _async_client[1].close())
+            _spawn(loop, _close_at_shutdown(loop, client))
+        _async_client = (loop, client)
+    return _async_client[1]
+
+
+async def _close_at_shutdown(loop: asyncio.AbstractEventLoop, client: "AsyncOpenAI") -> None:
+    """Wait until the loop cancels its remaining tasks on shutdown, then close client
+    
+    asyncio.run() cancels pending tasks before closing the loop, so the pool is
+    closed while the loop it belongs to can still run the close.
+    """
+    global _async_client
+    try:
+        await loop.create_future()
+    finally:
+        if _async_client is not None and _async_client[1] is client:
+            _async_client = None
+        await client.close()
+
+
+def _spawn(loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, None]) -> None:
+    """Run coro as a task on loop, holding a reference until it finishes"""
+    task = loop.create_task(coro)
+    _close_tasks.add(task)
+    task.add_done_callback(_close_tasks.discard)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Tests for the API retry policy, using stubbed OpenAI clients
+"""
+
+import asyncio
+import os
+import types
+import unittest
+from unittest import mock
+
+import httpx
+import openai
+
+import ai_summary_generator
+import api_retry
+from api_retry import CircuitBreaker, RateLimiter, call_with_retry
+from ai_summary_generator import AISummaryGenerator
+from flow_parser import UserAction
+
+_REQUEST = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+_real_sleep = asyncio.sleep
+
+
+async def _skip_backoff(delay: float) -> None:
+    """Stand-in for asyncio.sleep that still lets other tasks run"""
+    await _real_sleep(0)
+
+
+def _rate_limit_error(headers: dict = None) -> openai.RateLimitError:
+    response = httpx.Response(429, headers=headers or {}, request=_REQUEST)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def _server_error(headers: dict = None) -> openai.InternalServerError:
+    response = httpx.Response(503, headers=headers or {}, request=_REQUEST)
+    return openai.InternalServerError("Service unavailable", response=response, body=None)
+
+
+def _completion(content: str):
+    message = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message, finish_reason='stop')])
+
+
+class _RateLimitedOnceCompletions:
+    """Async chat.completions stub that answers 429 the first time it sees each request"""
+
+    def __init__(self):
+        self.seen = set()
+        self.calls = 0
+
+    async def create(self, **request):
+        self.calls += 1
+        await _real_sleep(0)  # Let every flow send its first request before any retry
+        key = repr(request['messages'])
+        if key not in self.seen:
+            self.seen.add(key)
+            raise _rate_limit_error()
+        return _completion("BRAND: Target\nPRODUCT_TYPE: scooter\nTASK_TYPE: online shopping")
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        sleep = mock.patch.object(api_retry.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def test_retry_after_sets_delay_and_does_not_count_toward_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        func = mock.Mock(side_effect=[_server_error({'retry-after': '2'}), 'ok'])
+
+        self.assertEqual(call_with_retry(func, breaker), 'ok')
+        self.sleep.assert_called_once_with(2.0)
+
+        failing = mock.Mock(side_effect=_server_error({'retry-after': '2'}))
+        with self.assertRaises(openai.InternalServerError):
+            call_with_retry(failing, breaker)
+        self.assertEqual(breaker.failures, 0)
+        breaker.check()  # Still closed
+
+    def test_exhausted_rate_limits_do_not_open_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        func = mock.Mock(side_effect=_rate_limit_error())
+
+        with self.assertRaises(openai.RateLimitError):
+            call_with_retry(func, breaker)
+        self.assertEqual(func.call_count, api_retry.MAX_ATTEMPTS)
+        self.assertEqual(breaker.failures, 0)
+
+    def test_only_exhausted_calls_count_toward_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        flaky = mock.Mock(side_effect=[_server_error()] * (api_retry.MAX_ATTEMPTS - 1) + ['ok'])
+        self.assertEqual(call_with_retry(flaky, breaker), 'ok')
+        self.assertEqual(breaker.failures, 0)
+
+        for _ in range(2):
+            with self.assertRaises(openai.InternalServerError):
+                call_with_retry(mock.Mock(side_effect=_server_error()), breaker)
+        with self.assertRaises(api_retry.CircuitOpenError):
+            call_with_retry(mock.Mock(return_value='ok'), breaker)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_multi_image_request_holds_n_slots(self):
+        limiter = RateLimiter(requests_per_minute=60)
+        with mock.patch.object(api_retry.time, 'monotonic', return_value=100.0):
+            self.assertEqual(limiter._reserve(3), 0.0)
+            self.assertEqual(limiter._reserve(), 3.0)
+            self.assertEqual(limiter._reserve(), 4.0)
+
+
+class ConcurrentRateLimitTest(unittest.TestCase):
+
+    def test_one_rate_limit_per_request_does_not_fail_concurrent_flows(self):
+        completions = _RateLimitedOnceCompletions()
+        client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+        patches = [
+            mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'test'}),
+            mock.patch.object(ai_summary_generator, 'get_async_client', return_value=client),
+            mock.patch.object(ai_summary_generator, '_circuit_breaker', CircuitBreaker()),
+            mock.patch.object(ai_summary_generator, '_acache_get', new_callable=mock.AsyncMock, return_value=None),
+            mock.patch.object(ai_summary_generator, '_acache_put', new_callable=mock.AsyncMock),
+            mock.patch.object(api_retry.asyncio, 'sleep', _skip_backoff),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        flows = [([UserAction(1, 'search', f"Searched for item {i}")], f"Flow {i}") for i in range(8)]
+        results = asyncio.run(AISummaryGenerator().agenerate_many(flows))
+
+        for summary, insights in results:
+            self.assertFalse(summary['detailed_analysis'].startswith("Error generating analysis"))
+            self.assertEqual(insights['extracted_brand'], 'Target')
+        # Every request failed once and succeeded on its second attempt
+        self.assertEqual(completions.calls, 2 * len(completions.seen))
+
+
+if __name__ == '__main__':
+    unittest.main()
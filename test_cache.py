@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for the on-disk response cache, using a temporary cache directory
+"""
+
+import os
+import tempfile
+import time
+import types
+import unittest
+from collections import OrderedDict
+from pathlib import Path
+from unittest import mock
+
+import ai_summary_generator
+import cache
+from api_retry import CircuitBreaker
+from ai_summary_generator import AISummaryGenerator
+
+
+def _completion(content: str, finish_reason: str = 'stop'):
+    message = types.SimpleNamespace(content=content)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message, finish_reason=finish_reason)])
+
+
+class _CacheDirTest(unittest.TestCase):
+    """Points the cache at a fresh temporary directory with empty in-memory state"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = Path(tmp.name)
+        patches = [
+            mock.patch.object(cache, 'CACHE_DIR', self.cache_dir),
+            mock.patch.object(cache, '_cache_bytes', None),
+            mock.patch.object(ai_summary_generator, '_response_cache', OrderedDict()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _age(self, key: str, seconds: float) -> None:
+        """Backdate the file stored under key"""
+        mtime = time.time() - seconds
+        os.utime(self.cache_dir / key, (mtime, mtime))
+
+
+class DiskTTLTest(_CacheDirTest):
+
+    def test_expired_disk_entry_is_a_miss_and_is_deleted(self):
+        ai_summary_generator._cache_put('stale', 'old content')
+        self._age('stale.txt', ai_summary_generator._CACHE_TTL_SECONDS + 60)
+        ai_summary_generator._response_cache.clear()  # As in a fresh process
+
+        self.assertIsNone(ai_summary_generator._cache_get('stale'))
+        self.assertFalse((self.cache_dir / 'stale.txt').exists())
+
+    def test_fresh_disk_entry_keeps_its_age_in_memory(self):
+        ai_summary_generator._cache_put('fresh', 'new content')
+        self._age('fresh.txt', 600)
+        ai_summary_generator._response_cache.clear()
+
+        self.assertEqual(ai_summary_generator._cache_get('fresh'), 'new content')
+        stored_at, _ = ai_summary_generator._response_cache['fresh']
+        self.assertAlmostEqual(time.monotonic() - stored_at, 600, delta=5)
+
+
+class SizeCapTest(_CacheDirTest):
+
+    def test_oldest_entries_are_evicted_first(self):
+        with mock.patch.object(cache, 'CACHE_MAX_BYTES', 3000):
+            for i in range(3):
+                cache.cache_put(f"entry{i}", b'x' * 1000)
+                self._age(f"entry{i}", 100 - i)  # entry0 is the oldest
+            cache.cache_put('entry3', b'x' * 1000)
+
+        remaining = sorted(path.name for path in self.cache_dir.iterdir())
+        self.assertEqual(remaining, ['entry2', 'entry3'])
+        self.assertIsNone(cache.cache_get('entry0'))
+
+    def test_rewriting_a_key_does_not_grow_the_total(self):
+        with mock.patch.object(cache, 'CACHE_MAX_BYTES', 3000):
+            for _ in range(10):
+                cache.cache_put('same', b'x' * 1000)
+            cache.cache_put('other', b'x' * 1000)
+
+        self.assertEqual(sorted(path.name for path in self.cache_dir.iterdir()), ['other', 'same'])
+
+
+class InvalidJSONTest(_CacheDirTest):
+
+    def setUp(self):
+        super().setUp()
+        self.create = mock.Mock()
+        client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create)))
+        patches = [
+            mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'test'}),
+            mock.patch.object(ai_summary_generator, 'get_client', return_value=client),
+            mock.patch.object(ai_summary_generator, '_circuit_breaker', CircuitBreaker()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.generator = AISummaryGenerator()
+        self.request = {
+            "model": "gpt-4.1",
+            "messages": [{"role": "user", "content": "Report on this flow"}],
+            "response_format": {"type": "json_object"},
+        }
+
+    def _assert_not_cached(self):
+        key = ai_summary_generator._cache_key(self.request)
+        self.assertNotIn(key, ai_summary_generator._response_cache)
+        self.assertEqual(list(self.cache_dir.iterdir()), [])
+
+    def test_truncated_response_is_not_cached(self):
+        self.create.return_value = _completion('{"detailed_analysis": "cut o', finish_reason='length')
+        with self.assertRaises(ValueError):
+            self.generator._complete(self.request)
+        self._assert_not_cached()
+
+    def test_malformed_json_is_not_cached(self):
+        self.create.return_value = _completion('{"detailed_analysis": oops}')
+        with self.assertRaises(ValueError):
+            self.generator._complete(self.request)
+        self._assert_not_cached()
+
+    def test_valid_json_is_cached(self):
+        self.create.return_value = _completion('{"detailed_analysis": "ok"}')
+        self.assertEqual(self.generator._complete(self.request), '{"detailed_analysis": "ok"}')
+        self.assertEqual(self.generator._complete(self.request), '{"detailed_analysis": "ok"}')
+        self.create.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
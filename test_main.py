@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Tests for report file naming in the analysis pipeline
+"""
+
+import os
+import tempfile
+import unittest
+
+from main import _create_report_file
+
+
+class ReportFileTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base_name = os.path.join(tmp.name, 'flow_analysis_report_Checkout_20250101_120000')
+
+    def test_same_base_name_gets_distinct_suffixed_files(self):
+        filenames = []
+        for i in range(3):
+            filename, f = _create_report_file(self.base_name)
+            with f:
+                f.write(f"report {i}")
+            filenames.append(filename)
+
+        self.assertEqual(filenames, [
+            f"{self.base_name}.md",
+            f"{self.base_name}_2.md",
+            f"{self.base_name}_3.md",
+        ])
+        for i, filename in enumerate(filenames):
+            with open(filename, encoding='utf-8') as f:
+                self.assertEqual(f.read(), f"report {i}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for social image generation, using a stubbed OpenAI client
+"""
+
+import asyncio
+import base64
+import os
+import types
+import unittest
+from unittest import mock
+
+import social_image_generator
+from api_retry import CircuitBreaker, RateLimiter
+from flow_parser import UserAction
+from social_image_generator import SocialImageGenerator
+
+
+class _CountingImages:
+    """Async images stub that records every generate call"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, **request):
+        self.calls += 1
+        await asyncio.sleep(0)  # Give the other caller a chance to start its own request
+        image = types.SimpleNamespace(b64_json=base64.b64encode(b'png bytes').decode('ascii'))
+        return types.SimpleNamespace(data=[image])
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.images = _CountingImages()
+        client = types.SimpleNamespace(images=self.images)
+        patches = [
+            mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'test'}),
+            mock.patch.object(social_image_generator, 'get_async_client', return_value=client),
+            mock.patch.object(social_image_generator, '_circuit_breaker', CircuitBreaker()),
+            mock.patch.object(social_image_generator, '_rate_limiter', RateLimiter(requests_per_minute=60000)),
+            mock.patch.object(social_image_generator, 'cache_get', return_value=None),
+            mock.patch.object(social_image_generator, 'cache_put'),
+            mock.patch.object(SocialImageGenerator, '_save_image', side_effect=lambda data: f"saved {len(data)}"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_concurrent_identical_prompts_share_one_api_call(self):
+        generator = SocialImageGenerator()
+        actions = [UserAction(1, 'search', "Searched for scooters")]
+
+        async def run():
+            return await asyncio.gather(
+                generator.agenerate_image(actions, "Checkout"),
+                generator.agenerate_image(actions, "Checkout"),
+            )
+
+        filenames = asyncio.run(run())
+
+        self.assertEqual(self.images.calls, 1)
+        self.assertEqual(filenames, ["saved 9", "saved 9"])
+        self.assertEqual(social_image_generator._pending_images, {})
+
+
+if __name__ == '__main__':
+    unittest.main()